@@ -6,12 +6,17 @@ import re
 import time
 import builtins
 import keyword
+import bisect
+import functools
 import pty
 import fcntl
-import select
 import struct
 import subprocess
+import tempfile
 import termios
+import threading
+import queue
+from collections import OrderedDict, deque
 '''
 Good Luck any contributors, i'm going to be honest, this code kinda sucks and is a bit of a mess. I'm not the best with formatting and organization (as you can see, it one file) so good luck
 theres some comments in the code that might help you out
@@ -23,7 +28,66 @@ CONFIG = "CONFIG"
 AUTOCOMPLETE = "AUTOCOMPLETE"
 TERMINAL = "TERMINAL"
 
+# Highlighter, one alternation so a line is scanned once. Strings come before
+# comments so a '#' inside a string literal doesn't start a comment.
+# (A hand-written scanner with a keyword set lookup was benchmarked too, it
+# came out ~50% slower than letting re do the walking)
+_HL_RE = re.compile(
+    r'(?P<string>\".*?\"|\'.*?\')|(?P<comment>#.*$)|'
+    r'(?P<defcls>\b(?:def|class)\b)|'
+    r'(?P<kw>\b(?:' + '|'.join(k for k in keyword.kwlist if k not in ('def', 'class')) + r')\b)'
+)
+
+# Escape sequences sanitize_ansi strips, in one pass:
+#   CSI (Control Sequence Introducer), terminated by 0x40-0x7E (@ through ~)
+#   OSC (Operating System Command) - like title updates
+#   other miscellaneous charset codes
+_ANSI_RE = re.compile(rb'\x1b\[[0-9;?]*[@-~]|\x1b\].*?(?:\x07|\x1b\\)|\x1b[()][AB012]')
+
+# Splits pty output for TerminalEmulator.write: a CSI sequence is ESC [, params,
+# intermediates and a final byte, other escapes are ESC plus optional
+# intermediates (like ESC ( B) and one final byte other than '['. Printable
+# ASCII comes out as whole runs, anything else is one control byte at a time (a
+# malformed ESC is just dropped there)
+_TERM_TOKEN_RE = re.compile(rb'(?P<esc>\x1b\[[0-?]*[ -/]*[@-~]|\x1b[ -/]*[0-Z\\-~])|(?P<text>[\x20-\x7e]+)|(?P<ctl>[\x00-\xff])')
+# The start of one of those escapes running into the end of the data, i.e. a
+# sequence that a read cut in two
+_TERM_PARTIAL_RE = re.compile(rb'\x1b(?:\[[0-?]*[ -/]*|[ -/]*)\Z')
+
+# Curses keys -> what handle_terminal writes to the pty. The KEY_* codes are
+# plain module constants, they don't need initscr()
+_TERM_KEYMAP = {
+    curses.KEY_UP: b"\x1b[A",
+    curses.KEY_DOWN: b"\x1b[B",
+    curses.KEY_RIGHT: b"\x1b[C",
+    curses.KEY_LEFT: b"\x1b[D",
+    curses.KEY_HOME: b"\x1b[H",
+    curses.KEY_END: b"\x1b[F",
+    curses.KEY_PPAGE: b"\x1b[5~",
+    curses.KEY_NPAGE: b"\x1b[6~",
+    curses.KEY_DC: b"\x1b[3~",
+    curses.KEY_IC: b"\x1b[2~",
+    curses.KEY_BACKSPACE: b"\x08",
+    127: b"\x08",
+    10: b"\n",
+    9: b"\t",  # Tab
+}
+
+# ASCII code -> one-char string, an index instead of a chr() call per typed
+# key or escape sequence
+_CHR = [chr(i) for i in range(128)]
+
+# 0-255 channel -> curses 0-1000 color intensity
+_SCALE = [v * 1000 // 255 for v in range(256)]
+
 class Editor:
+    # Typing pause before ghost-text completions are requested
+    AC_DEBOUNCE_MS = 20
+    # How long a notification stays on screen
+    NOTIFY_SECONDS = 3
+    # Distinct line texts whose highlight colors are kept around
+    HL_CACHE_SIZE = 2048
+
     def __init__(self, stdscr, filename=None):
         self.stdscr = stdscr
         self.filename = filename
@@ -33,9 +97,33 @@ class Editor:
         self.lines = [""]
         self.mode = NORMAL
         self.command_text = ""
-        self.undo_stack = []
-        self.redo_stack = []
+        # Limit undo stack size to 100, deque drops the oldest step in O(1)
+        self.undo_stack = deque(maxlen=100)
+        self.redo_stack = deque()
         self.show_line_numbers = True
+        # Key -> action for the two modes nearly every keystroke goes through,
+        # so a key is one dict lookup instead of a walk down an elif chain
+        self._normal_keys = {
+            ord('i'): self.enter_insert,
+            ord(':'): self.enter_command,
+            ord('h'): lambda: self.move(-1, 0),
+            ord('j'): lambda: self.move(0, 1),
+            ord('k'): lambda: self.move(0, -1),
+            ord('l'): lambda: self.move(1, 0),
+            ord('x'): self.delete_char,
+            ord('o'): self.open_line,
+        }
+        self._insert_keys = {
+            27: self.leave_insert,  # ESC
+            curses.KEY_UP: lambda: self.move(0, -1),
+            curses.KEY_DOWN: lambda: self.move(0, 1),
+            curses.KEY_LEFT: lambda: self.move(-1, 0),
+            curses.KEY_RIGHT: self.right_or_accept,
+            curses.KEY_BACKSPACE: self.backspace_key,
+            127: self.backspace_key,
+            9: self.tab_key,
+            10: self.enter_key,
+        }
         self.config_index = 0
         self.config_input = ""
         self.is_inputting = False
@@ -44,14 +132,48 @@ class Editor:
         self.lsp = None
         self.ac_suggestions = []
         self.ac_index = 0
+        self._ac_pending_word = None
+        self._ac_pending_since = 0.0
+        # get_current_word memo: the line object and column it was computed for
+        self._word_line = None
+        self._word_x = None
+        self._current_word = ""
+        # draw_autocomplete_popup's padded rows and the list they were built from
+        self._ac_popup_for = None
+        self._ac_popup_rows = []
+        self._ac_popup_width = 0
         self.is_python = filename and filename.endswith('.py')
+        # line text -> colors, LRU. Keyed by content so edits, undo and rows
+        # shifting around never leave a stale entry behind
+        self._color_cache = OrderedDict()
+        # Frame buffers for draw(), see put/flush_frame
+        self._next_frame = []
+        self._prev_frame = None
+        self._prev_cursor = None
+        # Set when something visible changed, run() only draws dirty frames
+        self._dirty = True
+        # Wrap layout: per-row (start, end) segments, plus their prefix sums
+        self._line_wraps = None
+        self._wrap_width = None
+        self._wrap_prefix = [0]
+        self._wrap_prefix_from = 0
+        # Formatted line numbers, grown on demand by draw()
+        self._gutter_cache = []
+        # "\n".join(self.lines), see get_code
+        self._joined_code = None
         
         self.term_fd = None
         self.term_pid = None
+        # Keys for the pty, written once per loop iteration by flush_terminal_input
+        self._term_out = bytearray()
         self.terminal = None
         
         if self.is_python:
             self.lsp = PythonLSP()
+            # Ghost-text completions go through lsp.request_completions so Jedi
+            # never blocks drawing, answers are matched back by request id
+            self._ac_request_id = 0
+            self._ac_in_flight = False
         
         # Tokyonight Palette
         self.tokyonight = {
@@ -71,6 +193,18 @@ class Editor:
             {"name": "Comment Color", "type": "color", "pair": 3, "hex": self.tokyonight["comment"]},
             {"name": "Def/Class Color", "type": "color", "pair": 4, "hex": self.tokyonight["def"]},
         ]
+        # One pass to resolve each color option's curses color index and RGB,
+        # plus where the fg/bg options live, so recoloring never searches the list
+        for i, opt in enumerate(self.config_options):
+            if opt["type"] != "color":
+                continue
+            # We use color indices 10 and above for our custom colors
+            opt["_color_idx"] = i + 10
+            opt["_rgb"] = self.hex_to_rgb(opt["hex"])
+            if opt.get("bg"):
+                self._bg_opt_idx = i
+            if opt.get("fg"):
+                self._fg_opt_idx = i
 
         if curses.has_colors():
             curses.start_color()
@@ -124,11 +258,36 @@ class Editor:
                 curses.init_pair(20, curses.COLOR_BLACK, curses.COLOR_BLUE)
                 curses.init_pair(23, curses.COLOR_WHITE, curses.COLOR_BLACK)
 
+        # Attr ints for the editor's color pairs, so draw code indexes a list
+        # instead of calling into curses for every segment
+        self._cp = [curses.color_pair(k) for k in range(24)]
+        # Highlighter group name -> attr
+        self._hl_attrs = {
+            "kw": self._cp[1],
+            "defcls": self._cp[4] | curses.A_BOLD,
+            "string": self._cp[2],
+            "comment": self._cp[3],
+        }
+
         if filename and os.path.exists(filename):
-            with open(filename, "r", encoding="utf-8") as f:
-                self.lines = f.read().splitlines()
-                if not self.lines:
-                    self.lines = [""]
+            self.load(filename)
+
+    def load(self, filename):
+        # Read in blocks and split as we go, so a big file never exists as one
+        # whole string next to its list of lines (roughly halves peak memory)
+        lines = []
+        tail = ""
+        with open(filename, "r", encoding="utf-8") as f:
+            while True:
+                chunk = f.read(1 << 20)
+                if not chunk:
+                    break
+                parts = (tail + chunk).split("\n")
+                tail = parts.pop()
+                lines += parts
+        if tail:
+            lines.append(tail)
+        self.lines = lines or [""]
 
     def run(self):
         curses.curs_set(1)
@@ -137,14 +296,33 @@ class Editor:
         while True:
             if self.mode == TERMINAL:
                 self.update_terminal()
+            if self.is_python:
+                self.poll_completions()
+            now = time.time()
+            if self.notifications and now - self.notifications[0]["time"] >= self.NOTIFY_SECONDS:
+                # Drop it here too, the config and terminal screens never call
+                # draw_notifications, so it would otherwise redraw every tick
+                self.notifications = [n for n in self.notifications if now - n["time"] < self.NOTIFY_SECONDS]
+                self._dirty = True  # a notification needs to disappear
             
-            self.draw()
-            # Set timeout for getch when in terminal mode to poll output
-            self.stdscr.timeout(10 if self.mode == TERMINAL else 100)
+            # Idle ticks with nothing new to show skip the whole draw pipeline
+            if self._dirty:
+                self.draw()
+                self._dirty = False
+            # Set timeout for getch when in terminal mode to poll output,
+            # and shorten it while a completion request is waiting to fire
+            if self.mode == TERMINAL:
+                self.stdscr.timeout(10)
+            else:
+                waiting = self._ac_pending_word or (self.is_python and self._ac_in_flight)
+                self.stdscr.timeout(self.AC_DEBOUNCE_MS if waiting else 100)
             key = self.stdscr.getch()
 
             if key == -1:
+                self.flush_completion_request()
                 continue
+            # Any handled key may change the buffer, cursor, mode or scroll
+            self._dirty = True
 
             if self.mode == NORMAL:
                 if self.show_dashboard:
@@ -156,12 +334,16 @@ class Editor:
             elif self.mode == INSERT:
                 # Proactively query LSP for ghost text if we have a word
                 self.handle_insert(key)
+                # The request itself is debounced, see flush_completion_request
                 if self.is_python and self.mode == INSERT:
                     word = self.get_current_word()
                     if word and len(word) > 1:
-                        code = "\n".join(self.lines)
-                        self.ac_suggestions = self.lsp.get_completions(code, self.cursor_y + 1, self.cursor_x)
+                        self._ac_pending_word = word
+                        self._ac_pending_since = time.monotonic()
+                        # Until the new answer arrives keep only what still fits the word
+                        self.ac_suggestions = [s for s in self.ac_suggestions if s.startswith(word)]
                     else:
+                        self.cancel_completion_request()
                         self.ac_suggestions = []
             elif self.mode == COMMAND:
                 if self.handle_command(key) == "QUIT":
@@ -171,112 +353,197 @@ class Editor:
             elif self.mode == AUTOCOMPLETE:
                 self.handle_autocomplete(key)
             elif self.mode == TERMINAL:
-                self.handle_terminal(key)
-
-    def save_state(self):
-        # Limit undo stack size to 100
-        if len(self.undo_stack) > 100:
-            self.undo_stack.pop(0)
+                # Take every key that's already queued (a paste arrives as one
+                # burst) so the pty gets a single write and the screen one redraw
+                self.stdscr.timeout(0)
+                while key != -1:
+                    self.handle_terminal(key)
+                    if self.mode != TERMINAL:
+                        break
+                    key = self.stdscr.getch()
+                self.flush_terminal_input()
+
+    def flush_completion_request(self):
+        # Only ask Jedi once typing pauses for AC_DEBOUNCE_MS and the word is still
+        # the one we stamped, instead of reparsing the buffer on every keystroke
+        word = self._ac_pending_word
+        if not word:
+            return
+        if self.mode != INSERT or self.get_current_word() != word:
+            self.cancel_completion_request()
+            return
+        if (time.monotonic() - self._ac_pending_since) * 1000 < self.AC_DEBOUNCE_MS:
+            return
+        hit = self.lsp.cached(self.lines[self.cursor_y], self.cursor_y + 1, self.cursor_x)
+        if hit is not None:
+            # Already have names for this spot, drop anything in flight and use them
+            self.cancel_completion_request()
+            self.ac_suggestions = hit
+            self._dirty = True
+            return
+        self._ac_pending_word = None
+        self._ac_request_id += 1
+        self._ac_in_flight = True
+        code = self.get_code()
+        self.lsp.request_completions(code, self.cursor_y + 1, self.cursor_x, self._ac_request_id)
+
+    def cancel_completion_request(self):
+        # Forget the pending request and ignore any answer still on its way
+        self._ac_pending_word = None
+        self._ac_request_id += 1
+        self._ac_in_flight = False
+
+    def poll_completions(self):
+        for request_id, suggestions in self.lsp.poll_completions():
+            if request_id == self._ac_request_id:
+                self._ac_in_flight = False
+                if self.mode == INSERT:
+                    self.ac_suggestions = suggestions
+                    self._dirty = True
+
+    # Undo history stores edits, not buffer snapshots. Each undo step is a dict with the
+    # cursor position and a list of ops (kind, row, col, payload):
+    #   ('ins', row, col, text)   text was inserted at row/col
+    #   ('del', row, col, text)   text was removed from row/col
+    #   ('split', row, col, None) row was broken in two at col
+    #   ('join', row, col, None)  row+1 was appended to row, which was col long
+    _UNDO_INVERSE = {'ins': 'del', 'del': 'ins', 'split': 'join', 'join': 'split'}
+
+    def save_state(self, merge=False):
+        # merge=True keeps typing in the same step while the cursor advances
+        # linearly, so a whole word undoes at once
+        if merge and self.undo_stack and not self.redo_stack:
+            ops = self.undo_stack[-1]['ops']
+            if len(ops) == 1 and ops[0][0] == 'ins':
+                _, row, col, text = ops[0]
+                if row == self.cursor_y and col + len(text) == self.cursor_x and not text.endswith(' '):
+                    return
         self.undo_stack.append({
-            'lines': list(self.lines),
+            'ops': [],
             'cursor_x': self.cursor_x,
             'cursor_y': self.cursor_y
         })
         self.redo_stack.clear()
 
+    def edit(self, kind, row, col, payload=None):
+        # Apply an edit to the buffer and record it in the current undo step
+        if not self.undo_stack:
+            self.save_state()
+        self.redo_stack.clear()
+        ops = self.undo_stack[-1]['ops']
+        if kind == 'ins' and ops and ops[-1][0] == 'ins':
+            _, last_row, last_col, text = ops[-1]
+            if last_row == row and last_col + len(text) == col:
+                ops[-1] = ('ins', row, last_col, text + payload)
+                self.apply_edit(kind, row, col, payload)
+                return
+        ops.append((kind, row, col, payload))
+        self.apply_edit(kind, row, col, payload)
+
+    def apply_edit(self, kind, row, col, payload):
+        line = self.lines[row]
+        if kind == 'ins':
+            self.lines[row] = line[:col] + payload + line[col:]
+            self.invalidate_line(row)
+        elif kind == 'del':
+            self.lines[row] = line[:col] + line[col + len(payload):]
+            self.invalidate_line(row)
+        elif kind == 'split':
+            self.lines[row] = line[:col]
+            self.lines.insert(row + 1, line[col:])
+            self.invalidate_line(row, shift=1)
+        elif kind == 'join':
+            self.lines[row] = line + self.lines[row + 1]
+            del self.lines[row + 1]
+            self.invalidate_line(row, shift=-1)
+
     def undo(self):
         if not self.undo_stack:
             return
+        state = self.undo_stack.pop()
         self.redo_stack.append({
-            'lines': list(self.lines),
+            'ops': state['ops'],
             'cursor_x': self.cursor_x,
             'cursor_y': self.cursor_y
         })
-        state = self.undo_stack.pop()
-        self.lines = state['lines']
+        for kind, row, col, payload in reversed(state['ops']):
+            self.apply_edit(self._UNDO_INVERSE[kind], row, col, payload)
         self.cursor_x = state['cursor_x']
         self.cursor_y = state['cursor_y']
 
     def redo(self):
         if not self.redo_stack:
             return
+        state = self.redo_stack.pop()
         self.undo_stack.append({
-            'lines': list(self.lines),
+            'ops': state['ops'],
             'cursor_x': self.cursor_x,
             'cursor_y': self.cursor_y
         })
-        state = self.redo_stack.pop()
-        self.lines = state['lines']
+        for kind, row, col, payload in state['ops']:
+            self.apply_edit(kind, row, col, payload)
         self.cursor_x = state['cursor_x']
         self.cursor_y = state['cursor_y']
 
     def handle_normal(self, key):
         self.show_dashboard = False
-        if key == ord('i'):
-            self.mode = INSERT
-        elif key == ord(':'):
-            self.mode = COMMAND
-            self.command_text = ""
-        elif key == ord('h'):
-            self.move(-1, 0)
-        elif key == ord('j'):
-            self.move(0, 1)
-        elif key == ord('k'):
-            self.move(0, -1)
-        elif key == ord('l'):
-            self.move(1, 0)
-        elif key == ord('x'):
-            self.delete_char()
-        elif key == ord('o'):
-            self.newline()
-            self.mode = INSERT
-        elif key == 27:  # ESC
-            pass  # Already in NORMAL
+        action = self._normal_keys.get(key)  # ESC and unbound keys do nothing
+        if action:
+            action()
+
+    def enter_insert(self):
+        self.mode = INSERT
+
+    def enter_command(self):
+        self.mode = COMMAND
+        self.command_text = ""
+
+    def open_line(self):
+        self.save_state()
+        self.newline()
+        self.mode = INSERT
 
     def handle_insert(self, key):
-        if key == 27:  # ESC
-            self.mode = NORMAL
-            self.ac_suggestions = []
-        elif key == curses.KEY_UP:
-            self.move(0, -1)
-        elif key == curses.KEY_DOWN:
-            self.move(0, 1)
-        elif key == curses.KEY_LEFT:
-            self.move(-1, 0)
-        elif key == curses.KEY_RIGHT and not self.ac_suggestions:
-            self.move(1, 0)
-        elif key in (curses.KEY_BACKSPACE, 127):
-            self.save_state()
-            self.backspace()
-        elif key == curses.KEY_RIGHT and self.ac_suggestions:
+        # Plain typing is by far the most common key, check it before the table
+        if 32 <= key <= 126:
+            self.save_state(merge=True)
+            self.insert(_CHR[key])
+            return
+        action = self._insert_keys.get(key)
+        if action:
+            action()
+
+    def leave_insert(self):
+        self.mode = NORMAL
+        self.ac_suggestions = []
+
+    def right_or_accept(self):
+        if self.ac_suggestions and self.ac_suggestions[0].startswith(self.get_current_word()):
             # Complete first suggestion
-            suggestion = self.ac_suggestions[0]
-            word = self.get_current_word()
-            self.save_state()
-            line = self.lines[self.cursor_y]
-            self.lines[self.cursor_y] = line[:self.cursor_x - len(word)] + suggestion + line[self.cursor_x:]
-            self.cursor_x += (len(suggestion) - len(word))
+            self.complete_word(self.ac_suggestions[0])
             self.ac_suggestions = []
-        elif key == 9:  # Tab
-            if self.is_python:
-                code = "\n".join(self.lines)
-                suggestions = self.lsp.get_completions(code, self.cursor_y + 1, self.cursor_x)
-                if suggestions:
-                    self.ac_suggestions = suggestions
-                    self.mode = AUTOCOMPLETE
-                    self.ac_index = 0
-                else:
-                    self.save_state()
-                    for _ in range(4): self.insert(' ')
-            else:
-                self.save_state()
-                for _ in range(4): self.insert(' ')
-        elif key == 10:  # Enter
-            self.save_state()
-            self.newline()
-        elif 32 <= key <= 126:
-            self.save_state()
-            self.insert(chr(key))
+        else:
+            self.move(1, 0)
+
+    def backspace_key(self):
+        self.save_state()
+        self.backspace()
+
+    def tab_key(self):
+        if self.is_python:
+            code = self.get_code()
+            suggestions = self.lsp.get_completions(code, self.cursor_y + 1, self.cursor_x)
+            if suggestions:
+                self.ac_suggestions = suggestions
+                self.mode = AUTOCOMPLETE
+                self.ac_index = 0
+                return
+        self.save_state()
+        for _ in range(4): self.insert(' ')
+
+    def enter_key(self):
+        self.save_state()
+        self.newline()
 
     def handle_command(self, key):
         if key == 27:  # ESC
@@ -284,14 +551,15 @@ class Editor:
         elif key == 10:  # Enter
             cmd = self.command_text.strip()
             if cmd == "w":
-                self.save()
-                self.notify("File Saved")
+                if self.save():
+                    self.notify("File Saved")
                 self.mode = NORMAL
             elif cmd == "q":
                 return "QUIT"
             elif cmd == "wq":
-                self.save()
-                return "QUIT"
+                if self.save():
+                    return "QUIT"
+                self.mode = NORMAL
             elif cmd == "u":
                 self.undo()
                 self.mode = NORMAL
@@ -311,14 +579,31 @@ class Editor:
                 # This logic is a bit flawed but fine for now
                 pass
         if 32 <= key <= 126:
-            self.command_text += chr(key)
+            self.command_text += _CHR[key]
 
     def get_current_word(self):
+        # Called from the key loop and again by every draw, so remember the last
+        # answer. The word only depends on the line text and the cursor column
         line = self.lines[self.cursor_y]
+        if self._word_line is line and self._word_x == self.cursor_x:
+            return self._current_word
         start = self.cursor_x
         while start > 0 and (line[start-1].isalnum() or line[start-1] == '_'):
             start -= 1
-        return line[start:self.cursor_x]
+        self._word_line = line
+        self._word_x = self.cursor_x
+        self._current_word = line[start:self.cursor_x]
+        return self._current_word
+
+    def complete_word(self, suggestion):
+        # Replace current word with suggestion
+        word = self.get_current_word()
+        self.save_state()
+        start = self.cursor_x - len(word)
+        if word:
+            self.edit('del', self.cursor_y, start, word)
+        self.edit('ins', self.cursor_y, start, suggestion)
+        self.cursor_x += (len(suggestion) - len(word))
 
     def handle_autocomplete(self, key):
         if key == 27:  # ESC
@@ -327,23 +612,8 @@ class Editor:
             self.ac_index = (self.ac_index + 1) % len(self.ac_suggestions)
         elif key == ord('k') or key == curses.KEY_UP:
             self.ac_index = (self.ac_index - 1) % len(self.ac_suggestions)
-        elif key == 10:  # Enter
-            suggestion = self.ac_suggestions[self.ac_index]
-            word = self.get_current_word()
-            # Replace current word with suggestion
-            self.save_state()
-            line = self.lines[self.cursor_y]
-            self.lines[self.cursor_y] = line[:self.cursor_x - len(word)] + suggestion + line[self.cursor_x:]
-            self.cursor_x += (len(suggestion) - len(word))
-            self.mode = INSERT
-            self.ac_suggestions = []
-        elif key == curses.KEY_RIGHT: # Accept current selection
-            suggestion = self.ac_suggestions[self.ac_index]
-            word = self.get_current_word()
-            self.save_state()
-            line = self.lines[self.cursor_y]
-            self.lines[self.cursor_y] = line[:self.cursor_x - len(word)] + suggestion + line[self.cursor_x:]
-            self.cursor_x += (len(suggestion) - len(word))
+        elif key == 10 or key == curses.KEY_RIGHT:  # Enter / Right accept current selection
+            self.complete_word(self.ac_suggestions[self.ac_index])
             self.mode = INSERT
             self.ac_suggestions = []
         else:
@@ -354,31 +624,24 @@ class Editor:
         hex_str = hex_str.lstrip('#')
         if len(hex_str) == 3:
             hex_str = ''.join([c*2 for c in hex_str])
-        r = int(hex_str[0:2], 16) * 1000 // 255
-        g = int(hex_str[2:4], 16) * 1000 // 255
-        b = int(hex_str[4:6], 16) * 1000 // 255
-        return r, g, b
+        n = int(hex_str, 16)
+        return _SCALE[n >> 16 & 0xFF], _SCALE[n >> 8 & 0xFF], _SCALE[n & 0xFF]
 
     def update_color_definition(self, opt):
         if not curses.can_change_color(): return
         
-        # We use color indices 10 and above for our custom colors
-        idx_offset = self.config_options.index(opt) + 10
-        r, g, b = self.hex_to_rgb(opt["hex"])
-        curses.init_color(idx_offset, r, g, b)
+        idx_offset = opt["_color_idx"]
+        curses.init_color(idx_offset, *opt["_rgb"])
         
         # Update pairs
-        bg_opt = next(o for o in self.config_options if o.get("bg"))
-        fg_opt = next(o for o in self.config_options if o.get("fg"))
-        bg_idx = self.config_options.index(bg_opt) + 10
-        fg_idx = self.config_options.index(fg_opt) + 10
+        bg_idx = self.config_options[self._bg_opt_idx]["_color_idx"]
+        fg_idx = self.config_options[self._fg_opt_idx]["_color_idx"]
         
         if opt.get("bg") or opt.get("fg"):
             # Update all pairs that use default background
             for o in self.config_options:
                 if o["type"] == "color":
-                    o_idx = self.config_options.index(o) + 10
-                    curses.init_pair(o["pair"], o_idx, bg_idx)
+                    curses.init_pair(o["pair"], o["_color_idx"], bg_idx)
             # Special case for pair 5 (default fg/bg)
             curses.init_pair(5, fg_idx, bg_idx)
         else:
@@ -390,6 +653,7 @@ class Editor:
                 opt = self.config_options[self.config_index]
                 if self.config_input.startswith('#') and len(self.config_input) in (4, 7):
                     opt["hex"] = self.config_input
+                    opt["_rgb"] = self.hex_to_rgb(opt["hex"])
                     self.update_color_definition(opt)
                 self.is_inputting = False
                 self.config_input = ""
@@ -401,7 +665,7 @@ class Editor:
             elif key in (curses.KEY_BACKSPACE, 127):
                 self.config_input = self.config_input[:-1]
             elif 32 <= key <= 126:
-                self.config_input += chr(key)
+                self.config_input += _CHR[key]
             return
 
         if key == 27 or key == ord('q'):  # ESC or q
@@ -431,95 +695,154 @@ class Editor:
         if not self.is_inputting:
             curses.curs_set(0) # Hide cursor in menu
 
-        # Draw box
+        # Draw box, one string per row
+        edge = "-" * menu_w
+        middle = "|" + " " * (menu_w - 2) + "|"
         for i in range(menu_h):
-            for j in range(menu_w):
-                char = " "
-                if i == 0 or i == menu_h - 1: char = "-"
-                elif j == 0 or j == menu_w - 1: char = "|"
-                self.stdscr.addstr(start_y + i, start_x + j, char)
+            self.put(start_y + i, start_x, edge if i == 0 or i == menu_h - 1 else middle)
 
-        self.stdscr.addstr(start_y + 1, start_x + 2, " Configuration Menu ", curses.A_BOLD)
-        self.stdscr.addstr(start_y + 2, start_x + 2, " (j/k: navigate, Enter: edit) ", curses.A_DIM)
+        self.put(start_y + 1, start_x + 2, " Configuration Menu ", curses.A_BOLD)
+        self.put(start_y + 2, start_x + 2, " (j/k: navigate, Enter: edit) ", curses.A_DIM)
 
+        cursor = None
         for i, opt in enumerate(self.config_options):
             is_selected = (i == self.config_index)
             style = curses.A_REVERSE if is_selected else curses.A_NORMAL
             
             label = f"{opt['name']}: "
-            self.stdscr.addstr(start_y + 4 + i, start_x + 2, label)
+            self.put(start_y + 4 + i, start_x + 2, label)
             
             pos_x = start_x + 2 + len(label)
             
             if opt["type"] == "toggle":
                 val = "[X]" if getattr(self, opt["attr"]) else "[ ]"
-                self.stdscr.addstr(start_y + 4 + i, pos_x, val, style)
+                self.put(start_y + 4 + i, pos_x, val, style)
             elif opt["type"] == "color":
                 hex_val = opt["hex"]
                 if is_selected and self.is_inputting:
                     hex_val = self.config_input + "_"
+                    cursor = (start_y + 4 + i, pos_x + len(self.config_input))
                 
-                self.stdscr.addstr(start_y + 4 + i, pos_x, hex_val, style)
+                self.put(start_y + 4 + i, pos_x, hex_val, style)
                 
                 # Preview square
-                preview_idx = i + 10
+                preview_idx = opt["_color_idx"]
                 curses.init_pair(100 + i, curses.COLOR_WHITE, preview_idx)
-                self.stdscr.addstr(start_y + 4 + i, pos_x + 10, "  ", curses.color_pair(100 + i))
+                self.put(start_y + 4 + i, pos_x + 10, "  ", curses.color_pair(100 + i))
 
         if self.is_inputting:
-            self.stdscr.addstr(start_y + menu_h - 2, start_x + 2, " Typing hex... (e.g. #FF0000) ", curses.A_DIM)
-
-        self.stdscr.refresh()
+            self.put(start_y + menu_h - 2, start_x + 2, " Typing hex... (e.g. #FF0000) ", curses.A_DIM)
+        return cursor
 
     def delete_char(self):
         self.save_state()
         line = self.lines[self.cursor_y]
         if self.cursor_x < len(line):
-            self.lines[self.cursor_y] = line[:self.cursor_x] + line[self.cursor_x+1:]
-
-        self.stdscr.refresh()
+            self.edit('del', self.cursor_y, self.cursor_x, line[self.cursor_x])
 
-    def get_line_colors(self, line):
-        colors = [0] * len(line)
+    def get_line_colors(self, row):
+        # Returns (start, end, attr) spans covering the whole line
+        line = self.lines[row]
         if not self.is_python:
-            return colors
-        
-        # Simple regex-based highlighting
-        keywords = r'\b(if|else|elif|while|for|in|import|from|as|return|yield|try|except|finally|with|pass|break|continue|None|True|False|and|or|not|is|lambda)\b'
-        def_class = r'\b(def|class)\b'
-        strings = r'(\".*?\"|\'.*?\')'
-        comments = r'#.*$'
-
-        for match in re.finditer(keywords, line):
-            for i in range(match.start(), match.end()):
-                colors[i] = curses.color_pair(1)
-        
-        for match in re.finditer(def_class, line):
-            for i in range(match.start(), match.end()):
-                colors[i] = curses.color_pair(4) | curses.A_BOLD
-
-        for match in re.finditer(strings, line):
-            for i in range(match.start(), match.end()):
-                colors[i] = curses.color_pair(2)
-
-        for match in re.finditer(comments, line):
-            for i in range(match.start(), match.end()):
-                colors[i] = curses.color_pair(3)
-
-        return colors
-
-    def get_wrapped_lines(self):
+            return [(0, len(line), 0)] if line else []
+
+        cache = self._color_cache
+        cached = cache.get(line)
+        if cached is not None:
+            cache.move_to_end(line)
+            return cached
+
+        # Simple regex-based highlighting, the gaps between matches are plain text
+        spans = []
+        pos = 0
+        hl_attrs = self._hl_attrs
+        for match in _HL_RE.finditer(line):
+            start, end = match.span()
+            if start > pos:
+                spans.append((pos, start, 0))
+            spans.append((start, end, hl_attrs[match.lastgroup]))
+            pos = end
+        if pos < len(line):
+            spans.append((pos, len(line), 0))
+
+        cache[line] = spans
+        if len(cache) > self.HL_CACHE_SIZE:
+            cache.popitem(last=False)
+        return spans
+
+    def invalidate_line(self, row, shift=0):
+        # Called after editing self.lines[row]. shift=1 means a row was inserted
+        # after it (newline), shift=-1 means the row after it was joined into it
+        self._joined_code = None
+        if self.lsp:
+            self.lsp.invalidate(None if shift else row + 1)
+        if self._line_wraps is not None:
+            rows_before = len(self._line_wraps[row])
+            self._line_wraps[row] = self.wrap_line(self.lines[row], self._wrap_width)
+            if shift > 0:
+                self._line_wraps.insert(row + 1, self.wrap_line(self.lines[row + 1], self._wrap_width))
+            elif shift < 0:
+                del self._line_wraps[row + 1]
+            # Row offsets below this row only move if its screen-row count changed
+            if shift or len(self._line_wraps[row]) != rows_before:
+                if self._wrap_prefix_from is None or row < self._wrap_prefix_from:
+                    self._wrap_prefix_from = row
+
+    def get_code(self):
+        # Whole buffer as one string, rebuilt only after an edit
+        if self._joined_code is None:
+            self._joined_code = "\n".join(self.lines)
+        return self._joined_code
+
+    def wrap_width(self):
         h, w = self.stdscr.getmaxyx()
         gutter_width = 5 if self.show_line_numbers else 0
-        width = w - 1 - gutter_width
-        wrapped = []
-        for i, line in enumerate(self.lines):
-            if not line:
-                wrapped.append((i, 0, 0))
-                continue
-            for j in range(0, len(line), width):
-                wrapped.append((i, j, min(j + width, len(line))))
-        return wrapped
+        return w - 1 - gutter_width
+
+    def wrap_line(self, line, width):
+        if not line:
+            return [(0, 0)]
+        return [(j, min(j + width, len(line))) for j in range(0, len(line), width)]
+
+    def get_line_wraps(self):
+        width = self.wrap_width()
+        if self._line_wraps is None or width != self._wrap_width or len(self._line_wraps) != len(self.lines):
+            self._wrap_width = width
+            self._line_wraps = [self.wrap_line(line, width) for line in self.lines]
+            self._wrap_prefix = [0]
+            self._wrap_prefix_from = 0
+        return self._line_wraps
+
+    def get_wrap_prefix(self):
+        # prefix[i] is the wrapped-row index where buffer row i starts. Edits only
+        # mark the first row whose offset may be stale, the rest is redone lazily
+        line_wraps = self.get_line_wraps()
+        prefix = self._wrap_prefix
+        start = self._wrap_prefix_from
+        if start is not None:
+            del prefix[start + 1:]
+            total = prefix[start]
+            for i in range(start, len(line_wraps)):
+                total += len(line_wraps[i])
+                prefix.append(total)
+            self._wrap_prefix_from = None
+        return prefix
+
+    def get_visible_wraps(self, first, count):
+        # (row, start, end) for wrapped rows first .. first+count-1. The starting
+        # buffer row comes from bisecting the prefix sums, so only the rows on
+        # screen are ever built, not the whole file
+        prefix = self.get_wrap_prefix()
+        line_wraps = self._line_wraps
+        row = bisect.bisect_right(prefix, first) - 1
+        skip = first - prefix[row]
+        visible = []
+        while row < len(line_wraps) and len(visible) < count:
+            for start, end in line_wraps[row][skip:skip + count - len(visible)]:
+                visible.append((row, start, end))
+            skip = 0
+            row += 1
+        return visible
 
     def draw_dashboard(self):
         h, w = self.stdscr.getmaxyx()
@@ -538,8 +861,8 @@ class Editor:
         ]
         start_y = (h - len(logo)) // 2
         for i, line in enumerate(logo):
-            style = curses.color_pair(1) | curses.A_BOLD if i < 6 else curses.color_pair(5)
-            self.stdscr.addstr(start_y + i, (w - len(line)) // 2, line, style)
+            style = self._cp[1] | curses.A_BOLD if i < 6 else self._cp[5]
+            self.put(start_y + i, (w - len(line)) // 2, line, style)
 
     def handle_dashboard(self, key):
         if key == ord('i'):
@@ -555,14 +878,15 @@ class Editor:
 
     def notify(self, msg):
         self.notifications.append({"msg": msg, "time": time.time()})
+        self._dirty = True
 
     def draw_notifications(self):
         h, w = self.stdscr.getmaxyx()
         now = time.time()
-        self.notifications = [n for n in self.notifications if now - n["time"] < 3]
+        self.notifications = [n for n in self.notifications if now - n["time"] < self.NOTIFY_SECONDS]
         for i, n in enumerate(self.notifications):
             msg = f" {n['msg']} "
-            self.stdscr.addstr(h - 4 - i, w - len(msg) - 2, msg, curses.color_pair(21) | curses.A_BOLD)
+            self.put(h - 4 - i, w - len(msg) - 2, msg, self._cp[21] | curses.A_BOLD)
 
     def open_terminal(self):
         h, w = self.stdscr.getmaxyx()
@@ -589,145 +913,217 @@ class Editor:
             self.mode = NORMAL
             return
         
+        if key in _TERM_KEYMAP:
+            self._term_out += _TERM_KEYMAP[key]
+        elif 0 <= key <= 255:
+            self._term_out.append(key)
+
+    def flush_terminal_input(self):
+        if not self._term_out:
+            return
+        if self.term_fd is None:
+            self._term_out.clear()
+            return
         try:
-            # Map curses keys to ANSI sequences
-            mappping = {
-                curses.KEY_UP: b"\x1b[A",
-                curses.KEY_DOWN: b"\x1b[B",
-                curses.KEY_RIGHT: b"\x1b[C",
-                curses.KEY_LEFT: b"\x1b[D",
-                curses.KEY_HOME: b"\x1b[H",
-                curses.KEY_END: b"\x1b[F",
-                curses.KEY_PPAGE: b"\x1b[5~",
-                curses.KEY_NPAGE: b"\x1b[6~",
-                curses.KEY_DC: b"\x1b[3~",
-                curses.KEY_IC: b"\x1b[2~",
-            }
-            if key in mappping:
-                os.write(self.term_fd, mappping[key])
-            elif key == curses.KEY_BACKSPACE or key == 127:
-                os.write(self.term_fd, b"\x08")
-            elif key == 10:
-                os.write(self.term_fd, b"\n")
-            elif key == 9: # Tab
-                os.write(self.term_fd, b"\t")
-            elif 0 <= key <= 255:
-                os.write(self.term_fd, bytes([key]))
+            written = os.write(self.term_fd, self._term_out)
+            del self._term_out[:written]
+        except BlockingIOError:
+            pass  # pty is full, the rest goes out on a later iteration
         except OSError:
-            pass
+            self._term_out.clear()
 
     def sanitize_ansi(self, data):
-        # Strip CSI (Control Sequence Introducer)
-        # Proper CSI termination characters are in the range 0x40-0x7E (@ through ~)
-        data = re.sub(r'\x1b\[[0-9;?]*[@-~]', '', data)
-        # Strip OSC (Operating System Command) - like title updates
-        data = re.sub(r'\x1b\].*?(\x07|\x1b\\)', '', data)
-        # Strip other miscellaneous codes
-        data = re.sub(r'\x1b[()][AB012]', '', data)
-        return data
+        # Takes the raw bytes from os.read, see _ANSI_RE
+        return _ANSI_RE.sub(b'', data)
 
     def update_terminal(self):
         if self.term_fd is None: return
+        self.flush_terminal_input()
         try:
-            r, _, _ = select.select([self.term_fd], [], [], 0)
-            if r:
-                data = os.read(self.term_fd, 8192)
+            # The fd is non-blocking, so just try the read instead of polling first
+            data = os.read(self.term_fd, 8192)
+            if data:
                 self.terminal.write(data)
+                self._dirty = True
+        except BlockingIOError:
+            pass
         except (OSError, EOFError):
             self.term_fd = None
             self.mode = NORMAL
+            self._dirty = True
 
     def draw_terminal(self, h, w):
         if not self.terminal: return
-        for y in range(h - 2):
-            for x in range(w):
-                char, attr = self.terminal.screen[y][x]
-                try:
-                    self.stdscr.addch(y, x, char, attr)
-                except curses.error:
-                    pass
+        # Zip each emulator row back into (char, attr) cells and copy it in one go
+        term = self.terminal
+        for y in range(min(h - 2, term.h)):
+            self.put_cells(y, 0, list(zip(term.chars[y], term.attrs[y])))
         
-        # Move cursor
+        # Cursor position
         ty, tx = self.terminal.cursor_y, self.terminal.cursor_x
         if 0 <= ty < h - 2 and 0 <= tx < w:
-            self.stdscr.move(ty, tx)
+            return ty, tx
 
     def draw_statusline(self, h, w):
         # Background for statusline
-        self.stdscr.addstr(h - 2, 0, " " * (w - 1), curses.color_pair(23))
+        self.put(h - 2, 0, " " * (w - 1), self._cp[23])
         
         # Mode Segment
         mode_colors = {NORMAL: 20, INSERT: 21, COMMAND: 22, CONFIG: 1, TERMINAL: 22}
         mode_pair = mode_colors.get(self.mode, 20)
         mode_str = f" {self.mode} "
-        self.stdscr.addstr(h - 2, 0, mode_str, curses.color_pair(mode_pair) | curses.A_BOLD)
+        self.put(h - 2, 0, mode_str, self._cp[mode_pair] | curses.A_BOLD)
         
         # Filename Segment
         filename = "TERMINAL" if self.mode == TERMINAL else (self.filename or "[No Name]")
-        self.stdscr.addstr(h - 2, len(mode_str) + 1, f" {filename} ", curses.color_pair(23))
+        self.put(h - 2, len(mode_str) + 1, f" {filename} ", self._cp[23])
         
         # Position Segment
         if self.mode != TERMINAL:
             pos_str = f" LOC: {self.cursor_y + 1}:{self.cursor_x + 1} "
-            self.stdscr.addstr(h - 2, w - len(pos_str) - 1, pos_str, curses.color_pair(20) | curses.A_BOLD)
+            self.put(h - 2, w - len(pos_str) - 1, pos_str, self._cp[20] | curses.A_BOLD)
 
     def draw_hintbar(self, h, w):
         if self.mode == TERMINAL:
             hints = " [Ctrl+W] Exit Terminal "
         else:
             hints = " [i] Insert  [:] Command  [h/j/k/l] Move  [u] Undo  [r] Redo "
-        self.stdscr.addstr(h - 1, 0, hints[:w-1], curses.A_DIM)
+        self.put(h - 1, 0, hints[:w-1], curses.A_DIM)
+
+    def put(self, y, x, text, attr=0):
+        # Draw into the pending frame instead of straight to curses, flush_frame
+        # then only sends what differs from the last frame. Clips like addstr would
+        # have errored, so callers don't need to guard the screen edges
+        frame = self._next_frame
+        if not 0 <= y < len(frame):
+            return
+        row = frame[y]
+        if x < 0:
+            text = text[-x:]
+            x = 0
+        elif x >= len(row):
+            return  # a negative slice below would grow the row past the screen
+        text = text[:len(row) - x]
+        if not text.isprintable():
+            # Every cell has to be exactly one screen column, but addstr expands
+            # tabs and draws control chars as ^X. Show them as one blank / '?'
+            text = "".join(c if c.isprintable() else " " if c == "\t" else "?" for c in text)
+        row[x:x + len(text)] = [(c, attr) for c in text]
+
+    def put_cells(self, y, x, cells):
+        # put() for a run of ready-made (char, attr) cells
+        frame = self._next_frame
+        if not 0 <= y < len(frame) or x < 0:
+            return
+        row = frame[y]
+        if x >= len(row):
+            return
+        cells = cells[:len(row) - x]
+        row[x:x + len(cells)] = cells
+
+    def begin_frame(self, h, w):
+        self._next_frame = [[(' ', 0)] * w for _ in range(h)]
+
+    def flush_frame(self, cursor=None):
+        frame = self._next_frame
+        prev = self._prev_frame
+        if prev is None or len(prev) != len(frame) or len(prev[0]) != len(frame[0]):
+            # First frame or the terminal was resized, repaint everything
+            self.stdscr.clear()
+            prev = None
+
+        changed = False
+        for y, row in enumerate(frame):
+            old = prev[y] if prev else None
+            if old == row:
+                continue
+            changed = True
+            x, w = 0, len(row)
+            while x < w:
+                if old is not None and row[x] == old[x]:
+                    x += 1
+                    continue
+                # One addstr per run of changed cells sharing an attribute
+                start, attr = x, row[x][1]
+                while x < w and row[x][1] == attr and (old is None or row[x] != old[x]):
+                    x += 1
+                try:
+                    self.stdscr.addstr(y, start, "".join(c for c, _ in row[start:x]), attr)
+                except curses.error:
+                    pass  # writing the bottom-right cell always "fails"
+        self._prev_frame = frame
+
+        if cursor and 0 <= cursor[0] < len(frame) and 0 <= cursor[1] < len(frame[0]):
+            self.stdscr.move(*cursor)
+        # Same cells and same cursor as last time, nothing to send to the terminal
+        if changed or cursor != self._prev_cursor:
+            self.stdscr.noutrefresh()
+            curses.doupdate()
+        self._prev_cursor = cursor
 
     def draw(self):
-        self.stdscr.erase()
         h, w = self.stdscr.getmaxyx()
-        self.stdscr.bkgd(' ', curses.color_pair(5))
+        self.stdscr.bkgd(' ', self._cp[5])
+        self.begin_frame(h, w)
 
         if self.mode == TERMINAL:
-            self.draw_terminal(h, w)
+            cursor = self.draw_terminal(h, w)
             self.draw_statusline(h, w)
             self.draw_hintbar(h, w)
-            self.stdscr.refresh()
+            self.flush_frame(cursor)
             return
 
         if self.show_dashboard:
             self.draw_dashboard()
-            self.stdscr.refresh()
+            self.flush_frame()
             return
 
         gutter_width = 5 if self.show_line_numbers else 0
-        wrapped = self.get_wrapped_lines()
+        total_wrapped = self.get_wrap_prefix()[-1]
         
-        max_scroll = max(0, len(wrapped) - (h - 2))
+        max_scroll = max(0, total_wrapped - (h - 2))
         self.scroll = min(self.scroll, max_scroll)
-        visible_wrapped = wrapped[self.scroll:self.scroll + h - 2]
+        visible_wrapped = self.get_visible_wraps(self.scroll, h - 2)
         
         cursor_screen_y = -1
         cursor_screen_x = -1
 
+        if self.show_line_numbers and visible_wrapped:
+            # Padded line-number strings only depend on the row, so format each once
+            gutter = self._gutter_cache
+            last_row = visible_wrapped[-1][0]
+            if last_row >= len(gutter):
+                gutter.extend(f"{n + 1:4} " for n in range(len(gutter), last_row + 1))
+
         for i, (line_idx, start, end) in enumerate(visible_wrapped):
             if self.show_line_numbers:
                 if start == 0:
-                    line_num_str = f"{line_idx + 1:4} "
-                    self.stdscr.addstr(i, 0, line_num_str, curses.color_pair(3) | curses.A_DIM)
+                    self.put(i, 0, gutter[line_idx], self._cp[3] | curses.A_DIM)
                 else:
-                    self.stdscr.addstr(i, 0, "     ")
+                    self.put(i, 0, "     ")
 
             line = self.lines[line_idx]
-            colors = self.get_line_colors(line)
             segment = line[start:end]
-            seg_colors = colors[start:end]
-            
-            for j, (char, color) in enumerate(zip(segment, seg_colors)):
-                self.stdscr.addch(i, j + gutter_width, char, color)
-            
+            if not self.is_python:
+                # Nothing to highlight, the whole segment is a single run
+                self.put(i, gutter_width, segment)
+            else:
+                # One put per highlight span, clipped to this wrapped segment
+                for s, e, attr in self.get_line_colors(line_idx):
+                    if e <= start:
+                        continue
+                    if s >= end:
+                        break
+                    s = max(s, start)
+                    self.put(i, s - start + gutter_width, line[s:min(e, end)], attr)
+
             if line_idx == self.cursor_y and start <= self.cursor_x <= end:
                 if self.cursor_x < end or (self.cursor_x == end and end == len(line)):
                     cursor_screen_y = i
                     cursor_screen_x = self.cursor_x - start + gutter_width
 
         if self.mode == CONFIG:
-            self.draw_config_menu()
+            self.flush_frame(self.draw_config_menu())
             return
 
         self.draw_statusline(h, w)
@@ -740,21 +1136,18 @@ class Editor:
             if suggestion.startswith(word):
                 ghost_text = suggestion[len(word):]
                 if ghost_text and cursor_screen_x + len(ghost_text) < w:
-                    self.stdscr.addstr(cursor_screen_y, cursor_screen_x, ghost_text, curses.A_DIM | curses.A_ITALIC)
+                    self.put(cursor_screen_y, cursor_screen_x, ghost_text, curses.A_DIM | curses.A_ITALIC)
 
+        cursor = (cursor_screen_y, cursor_screen_x) if cursor_screen_y != -1 else None
         if self.mode == AUTOCOMPLETE:
             self.draw_autocomplete_popup(cursor_screen_y, cursor_screen_x)
-            return
-
-        if self.mode == COMMAND:
-            self.stdscr.addstr(h - 1, 0, ":" + self.command_text[:w - 2], curses.A_BOLD)
-            self.stdscr.move(h - 1, len(self.command_text) + 1)
+        elif self.mode == COMMAND:
+            self.put(h - 1, 0, ":" + self.command_text[:w - 2], curses.A_BOLD)
+            cursor = (h - 1, min(len(self.command_text) + 1, w - 1))
         else:
             self.draw_hintbar(h, w)
-            if cursor_screen_y != -1:
-                self.stdscr.move(cursor_screen_y, cursor_screen_x)
 
-        self.stdscr.refresh()
+        self.flush_frame(cursor)
 
     def move(self, dx, dy):
         # Vertical movement in wrapped world is tricky.
@@ -769,61 +1162,96 @@ class Editor:
         
         # Update scroll to keep cursor visible
         h, w = self.stdscr.getmaxyx()
-        wrapped = self.get_wrapped_lines()
+        prefix = self.get_wrap_prefix()
         
-        # Find which wrapped line the cursor is on
-        cursor_wrapped_idx = -1
-        for i, (line_idx, start, end) in enumerate(wrapped):
-            if line_idx == self.cursor_y and start <= self.cursor_x <= end:
-                if self.cursor_x < end or (self.cursor_x == end and end == len(self.lines[line_idx])):
-                    cursor_wrapped_idx = i
-                    break
+        # Which wrapped line the cursor is on, straight from the row offsets.
+        # A cursor sitting at the very end of a line belongs to its last segment
+        segments = len(self._line_wraps[self.cursor_y])
+        cursor_wrapped_idx = prefix[self.cursor_y] + min(self.cursor_x // self._wrap_width, segments - 1)
         
-        if cursor_wrapped_idx != -1:
-            if cursor_wrapped_idx < self.scroll:
-                self.scroll = cursor_wrapped_idx
-            elif cursor_wrapped_idx >= self.scroll + h - 2:
-                self.scroll = cursor_wrapped_idx - (h - 3)
+        if cursor_wrapped_idx < self.scroll:
+            self.scroll = cursor_wrapped_idx
+        elif cursor_wrapped_idx >= self.scroll + h - 2:
+            self.scroll = cursor_wrapped_idx - (h - 3)
 
     def insert(self, ch):
-        line = self.lines[self.cursor_y]
-        self.lines[self.cursor_y] = line[:self.cursor_x] + ch + line[self.cursor_x:]
+        self.edit('ins', self.cursor_y, self.cursor_x, ch)
         self.cursor_x += 1
 
     def backspace(self):
         if self.cursor_x > 0:
             line = self.lines[self.cursor_y]
-            self.lines[self.cursor_y] = line[:self.cursor_x - 1] + line[self.cursor_x:]
+            self.edit('del', self.cursor_y, self.cursor_x - 1, line[self.cursor_x - 1])
             self.cursor_x -= 1
         elif self.cursor_y > 0:
             prev = self.lines[self.cursor_y - 1]
             self.cursor_x = len(prev)
-            self.lines[self.cursor_y - 1] += self.lines[self.cursor_y]
-            del self.lines[self.cursor_y]
+            self.edit('join', self.cursor_y - 1, len(prev))
             self.cursor_y -= 1
 
     def newline(self):
-        line = self.lines[self.cursor_y]
-        self.lines[self.cursor_y] = line[:self.cursor_x]
-        self.lines.insert(self.cursor_y + 1, line[self.cursor_x:])
+        self.edit('split', self.cursor_y, self.cursor_x)
         self.cursor_y += 1
         self.cursor_x = 0
 
     def save(self):
+        # Returns whether the file got written, a failure is shown with notify()
+        # instead of raising out of the key loop and taking unsaved edits with it
         if not self.filename:
-            return
-        with open(self.filename, "w", encoding="utf-8") as f:
-            f.write("\n".join(self.lines))
+            self.notify("No file name")
+            return False
+        # Stream the lines out instead of joining the buffer into one string, into a
+        # temp file that then replaces the original, so a failed save can't leave
+        # the file half written. mkstemp gives a unique name that starts out 0600,
+        # so the contents aren't readable by others before the chmod
+        path = os.path.realpath(self.filename)
+        try:
+            tmp = None
+            if os.path.exists(path):
+                try:
+                    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".pyrix-save")
+                except OSError:
+                    pass
+            if tmp is None:
+                # New file (nothing to protect), or can't create files next to it
+                # (e.g. the directory isn't writable): write the file in place
+                with open(path, "wb", buffering=1 << 20) as f:
+                    self.write_lines(f)
+                return True
+            try:
+                with open(fd, "wb", buffering=1 << 20) as f:
+                    self.write_lines(f)
+                os.chmod(tmp, os.stat(path).st_mode & 0o7777)
+                os.replace(tmp, path)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        except OSError as e:
+            self.notify(f"Save failed: {e.strerror or e}")
+            return False
+        return True
+
+    def write_lines(self, f):
+        lines = iter(self.lines)
+        f.write(next(lines).encode("utf-8"))
+        for line in lines:
+            f.write(b"\n")
+            f.write(line.encode("utf-8"))
 
     def draw_autocomplete_popup(self, cy, cx):
         h, w = self.stdscr.getmaxyx()
         if not self.ac_suggestions: return
         
-        visible_count = min(len(self.ac_suggestions), 10)
-        visible_items = self.ac_suggestions[:visible_count]
+        # Padded rows only change with the suggestion list, not every frame
+        if self._ac_popup_for is not self.ac_suggestions:
+            visible_items = self.ac_suggestions[:10]
+            self._ac_popup_width = max(len(s) for s in visible_items) + 4
+            self._ac_popup_rows = [f" {s} ".ljust(self._ac_popup_width) for s in visible_items]
+            self._ac_popup_for = self.ac_suggestions
+        rows = self._ac_popup_rows
         
-        pop_w = max(len(s) for s in visible_items) + 4
-        pop_h = visible_count
+        pop_w = self._ac_popup_width
+        pop_h = len(rows)
         
         # Boundary checks
         if cx + pop_w >= w:
@@ -836,17 +1264,12 @@ class Editor:
         else:
             py = cy + 1
             
-        for i, s in enumerate(visible_items):
+        # Keep the last column free, put() clips but never raises so no try needed
+        max_len = max(0, w - px - 1)
+        for i, label in enumerate(rows):
             if py + i >= h - 2: break # Don't draw over statusline
-            style = curses.color_pair(21) | curses.A_BOLD if i == self.ac_index else curses.color_pair(23)
-            # Ensure px + pop_w doesn't overshoot
-            label = f" {s} ".ljust(pop_w)
-            if px + len(label) >= w:
-                label = label[:w - px - 1]
-            try:
-                self.stdscr.addstr(py + i, px, label, style)
-            except:
-                pass
+            style = self._cp[21] | curses.A_BOLD if i == self.ac_index else self._cp[23]
+            self.put(py + i, px, label[:max_len], style)
 
 class TerminalEmulator:
     def __init__(self, h, w):
@@ -854,68 +1277,105 @@ class TerminalEmulator:
         self.w = w
         self.cursor_x = 0
         self.cursor_y = 0
-        self.current_attr = curses.color_pair(5)
-        self.screen = [[(' ', curses.color_pair(5)) for _ in range(w)] for _ in range(h)]
+        self.default_attr = curses.color_pair(5)
+        self.current_attr = self.default_attr
+        # SGR code -> attr it switches to
+        self.sgr_attrs = {0: self.default_attr}
+        for n in range(30, 38):
+            self.sgr_attrs[n] = curses.color_pair(40 + (n - 30))
+        # Characters and attrs are kept in parallel row lists rather than a
+        # (char, attr) tuple per cell, so blank rows are just list repeats
+        self.chars = [[' '] * w for _ in range(h)]
+        self.attrs = [[self.default_attr] * w for _ in range(h)]
+        # Blank rows that scroll and clear copy from, so rows get reused, not rebuilt
+        self._blank_chars = [' '] * w
+        self._blank_attrs = [self.default_attr] * w
         self.ansi_buf = b""
 
     def write(self, data):
+        if self.ansi_buf:
+            data = self.ansi_buf + data
+            self.ansi_buf = b""
+        # Hold back an escape sequence cut off at the end of this read until the
+        # rest arrives with the next one
+        esc = data.rfind(b'\x1b', -64)
+        if esc != -1 and _TERM_PARTIAL_RE.match(data, esc):
+            self.ansi_buf = data[esc:]
+            data = data[:esc]
+        for match in _TERM_TOKEN_RE.finditer(data):
+            kind = match.lastgroup
+            if kind == "text":
+                self.write_text(match.group())
+            elif kind == "esc":
+                self.handle_ansi(match.group())
+            else:
+                c = data[match.start()]
+                if c == 13: # CR
+                    self.cursor_x = 0
+                elif c == 10: # LF
+                    self.cursor_y += 1
+                    if self.cursor_y >= self.h:
+                        self.scroll()
+                elif c == 8: # BS
+                    self.cursor_x = max(0, self.cursor_x - 1)
+                elif c == 7: # BEL
+                    pass
+
+    def write_text(self, text):
+        # A run of printable ASCII. Copy it a row's worth at a time with slice
+        # assignment, wrapping (and scrolling) whenever a row fills up
+        text = text.decode("ascii")
         i = 0
-        while i < len(data):
-            char = data[i:i+1]
-            if char == b'\x1b':
-                # Start of ANSI sequence
-                j = i + 1
-                while j < len(data) and not (0x40 <= data[j] <= 0x7E):
-                    j += 1
-                if j < len(data):
-                    self.handle_ansi(data[i:j+1])
-                    i = j + 1
-                    continue
-            
-            c = char[0]
-            if c == 13: # CR
+        while i < len(text):
+            x = self.cursor_x
+            part = text[i:i + self.w - x]
+            end = x + len(part)
+            self.chars[self.cursor_y][x:end] = part
+            self.attrs[self.cursor_y][x:end] = [self.current_attr] * len(part)
+            i += len(part)
+            if end >= self.w:
                 self.cursor_x = 0
-            elif c == 10: # LF
                 self.cursor_y += 1
                 if self.cursor_y >= self.h:
                     self.scroll()
-            elif c == 8: # BS
-                self.cursor_x = max(0, self.cursor_x - 1)
-            elif c == 7: # BEL
-                pass
-            elif 32 <= c <= 126:
-                if self.cursor_x < self.w:
-                    self.screen[self.cursor_y][self.cursor_x] = (chr(c), self.current_attr)
-                    self.cursor_x += 1
-                    if self.cursor_x >= self.w:
-                        self.cursor_x = 0
-                        self.cursor_y += 1
-                        if self.cursor_y >= self.h:
-                            self.scroll()
-            i += 1
+            else:
+                self.cursor_x = end
 
     def scroll(self):
-        self.screen.pop(0)
-        self.screen.append([(' ', curses.color_pair(5)) for _ in range(self.w)])
+        # The row scrolling off the top comes back blanked as the new bottom row
+        row = self.chars.pop(0)
+        row[:] = self._blank_chars
+        self.chars.append(row)
+        row = self.attrs.pop(0)
+        row[:] = self._blank_attrs
+        self.attrs.append(row)
         self.cursor_y = self.h - 1
 
     def handle_ansi(self, seq):
         if not seq.startswith(b'\x1b['): return
-        cmd = chr(seq[-1])
-        params = seq[2:-1].split(b';')
-        
-        try:
-            nums = [int(p) if p else 0 for p in params]
-        except ValueError:
-            nums = [0]
+        cmd = _CHR[seq[-1]]
+
+        # Params are nearly always empty or one digit, only hand the rest to int()
+        nums = []
+        for p in seq[2:-1].split(b';'):
+            if len(p) == 1 and 48 <= p[0] <= 57:
+                nums.append(p[0] - 48)
+            elif not p:
+                nums.append(0)
+            else:
+                try:
+                    nums.append(int(p))
+                except ValueError:
+                    nums = [0]
+                    break
 
         if cmd == 'm': # SGR
             for n in nums:
-                if n == 0: self.current_attr = curses.color_pair(5)
-                elif 30 <= n <= 37: # FG
-                    self.current_attr = curses.color_pair(40 + (n - 30))
-                elif 40 <= n <= 47: # BG
-                    pass # Simple impl ignores BG for now
+                # Reset and FG codes map straight to an attr. BG (40-47) is
+                # ignored for now, like anything else not in the table
+                attr = self.sgr_attrs.get(n)
+                if attr is not None:
+                    self.current_attr = attr
                 elif n == 1: self.current_attr |= curses.A_BOLD
         elif cmd == 'H' or cmd == 'f': # CUP
             y = max(0, min(self.h - 1, (nums[0] if nums else 1) - 1))
@@ -924,11 +1384,30 @@ class TerminalEmulator:
         elif cmd == 'J': # ED
             n = nums[0] if nums else 0
             if n == 2: # Clear entire screen
-                self.screen = [[(' ', curses.color_pair(5)) for _ in range(self.w)] for _ in range(self.h)]
+                for row in self.chars:
+                    row[:] = self._blank_chars
+                for row in self.attrs:
+                    row[:] = self._blank_attrs
                 self.cursor_x = self.cursor_y = 0
         elif cmd == 'K': # EL
-            for x in range(self.cursor_x, self.w):
-                self.screen[self.cursor_y][x] = (' ', self.current_attr)
+            x = self.cursor_x
+            self.chars[self.cursor_y][x:] = self._blank_chars[x:]
+            self.attrs[self.cursor_y][x:] = [self.current_attr] * (self.w - x)
+
+@functools.lru_cache(maxsize=1)
+def _find_venv_site_packages():
+    # site-packages of the common venv location, looked up once per process.
+    # The running interpreter's own pythonX.Y dir is tried before listing lib/
+    venv_path = "/media/bentley/2TB/repos/.venv"
+    lib_dir = os.path.join(venv_path, "lib")
+    site_pkgs = os.path.join(lib_dir, f"python{sys.version_info.major}.{sys.version_info.minor}", "site-packages")
+    if os.path.isdir(site_pkgs):
+        return site_pkgs
+    if os.path.isdir(lib_dir):
+        p_dirs = [d for d in os.listdir(lib_dir) if d.startswith("python")]
+        if p_dirs:
+            return os.path.join(lib_dir, p_dirs[0], "site-packages")
+    return None
 
 class PythonLSP:
     def __init__(self):
@@ -936,15 +1415,9 @@ class PythonLSP:
         try:
             import jedi
         except ImportError:
-            venv_path = "/media/bentley/2TB/repos/.venv"
-            if os.path.exists(venv_path):
-                lib_dir = os.path.join(venv_path, "lib")
-                if os.path.exists(lib_dir):
-                    p_dirs = [d for d in os.listdir(lib_dir) if d.startswith("python")]
-                    if p_dirs:
-                        site_pkgs = os.path.join(lib_dir, p_dirs[0], "site-packages")
-                        if site_pkgs not in sys.path:
-                            sys.path.append(site_pkgs)
+            site_pkgs = _find_venv_site_packages()
+            if site_pkgs and site_pkgs not in sys.path:
+                sys.path.append(site_pkgs)
         
         try:
             import jedi
@@ -952,16 +1425,146 @@ class PythonLSP:
         except ImportError:
             self.jedi = None
 
+        # (line, text before the word, text after the cursor) -> (prefix, names).
+        # Typing "fo" -> "foo" keeps the same key, so the longer prefix is just a
+        # filter over the names Jedi already gave us for the shorter one
+        self._cache = OrderedDict()
+        # Lines that have entries (or a Jedi call running) in _cache, see invalidate
+        self._cache_lines = set()
+        # Tab completion runs on the main thread while ghost text runs on the editor's worker
+        self._lock = threading.Lock()
+        # Guards _cache, _cache_lines and _generation, only ever held for the
+        # dict work itself and never across a Jedi call
+        self._cache_lock = threading.Lock()
+        self._generation = 0
+        # Last buffer jedi parsed and its Script, so completing at another spot in
+        # an unchanged buffer skips the reparse
+        self._script_code = None
+        self._script = None
+        # Background requests, see request_completions. The worker starts with the first one
+        self._requests = queue.Queue()
+        self._responses = queue.Queue()
+        self._worker = None
+
+    CACHE_SIZE = 256
+
+    def invalidate(self, line=None):
+        # Called after an edit on line, None means lines were added or removed.
+        # Entries for the edited line are keyed by its text so they can stay, any
+        # other line was completed against a buffer that no longer exists.
+        # Only takes _cache_lock so an edit never waits on a running Jedi call;
+        # a result computed before this is simply not stored
+        with self._cache_lock:
+            if line is not None and self._cache_lines <= {line}:
+                return
+            if line is None or line not in self._cache_lines:
+                self._cache = OrderedDict()
+                self._cache_lines = set()
+            else:
+                self._cache = OrderedDict((k, v) for k, v in self._cache.items() if k[0] == line)
+                self._cache_lines = {line}
+            self._generation += 1
+
+    def _line_at(self, code, line):
+        start = 0
+        for _ in range(line - 1):
+            start = code.find("\n", start) + 1
+            if start == 0:
+                return ""
+        end = code.find("\n", start)
+        return code[start:] if end == -1 else code[start:end]
+
     def get_completions(self, code, line, column):
         if not self.jedi:
             return []
+        with self._lock:
+            return self._get_completions(code, line, column)
+
+    def _key(self, text, line, column):
+        start = column
+        while start > 0 and (text[start-1].isalnum() or text[start-1] == '_'):
+            start -= 1
+        return (line, text[:start], text[column:]), text[start:column]
+
+    def _filter(self, cached, prefix):
+        if cached[0] == prefix:
+            return cached[1]
+        # Jedi matches prefixes case-insensitively, so filter the same way
+        lowered = prefix.lower()
+        return [n for n in cached[1] if n.lower().startswith(lowered)]
+
+    def cached(self, text, line, column):
+        # Cache-only lookup from the line text, no buffer join and no Jedi lock, so
+        # the editor can answer a repeat request without a trip through its worker.
+        # None means ask get_completions
+        if not self.jedi:
+            return None
+        key, prefix = self._key(text, line, column)
+        with self._cache_lock:
+            cached = self._cache.get(key)
+        if cached is not None and prefix.startswith(cached[0]):
+            return self._filter(cached, prefix)
+        return None
+
+    def request_completions(self, code, line, column, request_id):
+        # Non-blocking get_completions. The names come back later from
+        # poll_completions as (request_id, names)
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._loop, daemon=True)
+            self._worker.start()
+        self._requests.put((code, line, column, request_id))
+
+    def poll_completions(self):
+        results = []
+        while True:
+            try:
+                results.append(self._responses.get_nowait())
+            except queue.Empty:
+                return results
+
+    def _loop(self):
+        while True:
+            request = self._requests.get()
+            # Latest wins, skip anything that was superseded while Jedi was busy
+            while True:
+                try:
+                    request = self._requests.get_nowait()
+                except queue.Empty:
+                    break
+            code, line, column, request_id = request
+            self._responses.put((request_id, self.get_completions(code, line, column)))
+
+    def _get_completions(self, code, line, column):
+        key, prefix = self._key(self._line_at(code, line), line, column)
+
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            hit = cached is not None and prefix.startswith(cached[0])
+            if hit:
+                self._cache.move_to_end(key)
+            else:
+                generation = self._generation
+                self._cache_lines.add(line)
+        if hit:
+            return self._filter(cached, prefix)
+
         try:
-            script = self.jedi.Script(code)
-            completions = script.complete(line, column)
-            return [c.name for c in completions]
+            if code != self._script_code:
+                self._script = self.jedi.Script(code)
+                self._script_code = code
+            completions = self._script.complete(line, column)
+            names = [c.name for c in completions]
         except:
             return []
 
+        with self._cache_lock:
+            if generation == self._generation:
+                self._cache[key] = (prefix, names)
+                self._cache.move_to_end(key)
+                if len(self._cache) > self.CACHE_SIZE:
+                    self._cache.popitem(last=False)
+        return names
+
 def main(stdscr):
     filename = sys.argv[1] if len(sys.argv) > 1 else None
     editor = Editor(stdscr, filename)